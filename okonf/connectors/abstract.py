@@ -1,7 +1,8 @@
 import asyncio
 from abc import ABC, abstractmethod
 from asyncio import Lock
-from typing import Dict, Optional
+from tempfile import NamedTemporaryFile
+from typing import AsyncIterator, Dict, Optional
 from dataclasses import dataclass
 
 from .exceptions import ShellError, NoSuchFileError
@@ -14,13 +15,29 @@ class CommandResult:
     stderr: bytes
 
 
+async def read_records(stream, separator: bytes) -> AsyncIterator[bytes]:
+    """Yield the non-empty records of an asyncio or asyncssh stream as they
+    are received."""
+    while True:
+        try:
+            record = await stream.readuntil(separator)
+        except asyncio.IncompleteReadError as error:
+            if error.partial:
+                yield error.partial
+            return
+        if record != separator:
+            yield record[: -len(separator)]
+
+
 class Executor(ABC):
 
     locks: Dict[str, Lock]
+    counters: Dict[str, int]
     is_root: bool
 
     def __init__(self, is_root: bool):
         self.locks = {}
+        self.counters = {}
         self.is_root = is_root
 
     @abstractmethod
@@ -38,7 +55,23 @@ class Executor(ABC):
             command=command,
             env=env,
         )
+        self.check_result(result, check=check, no_such_file=no_such_file)
+        return result.stdout.decode()
+
+    async def stream_output(
+        self, command: str, separator: str = "\n", check=True, no_such_file=False
+    ) -> AsyncIterator[str]:
+        """Yield the output of a command split on `separator`. Executors that
+        can stream override this to avoid holding the whole output in memory."""
+        output = await self.check_output(
+            command, check=check, no_such_file=no_such_file
+        )
+        for record in output.split(separator):
+            if record:
+                yield record
 
+    @staticmethod
+    def check_result(result: CommandResult, check=True, no_such_file=False) -> None:
         if no_such_file and result.exit_code and result.stderr:
             if result.stderr.endswith(b"No such file or directory\n"):
                 raise NoSuchFileError(
@@ -50,12 +83,18 @@ class Executor(ABC):
                 result.exit_code, stdout=result.stdout, stderr=result.stderr
             )
 
-        return result.stdout.decode()
-
     @abstractmethod
     async def put(self, path: str, local_path: str) -> None:
         raise NotImplementedError()
 
+    async def put_content(self, path: str, content: bytes) -> None:
+        """Write the given content to a file on the host. Executors override
+        this to write it without going through a temporary file."""
+        with NamedTemporaryFile() as tmpfile:
+            tmpfile.write(content)
+            tmpfile.flush()
+            await self.put(path, tmpfile.name)
+
     def lock(self, name: str):
         if name not in self.locks:
             self.locks[name] = asyncio.Lock()
@@ -1,13 +1,14 @@
 import asyncio
 import logging
 import os
+import signal
 from os.path import expanduser
 from shutil import copyfile
-from typing import Optional, Dict
+from typing import AsyncIterator, Optional, Dict
 
 import colorama
 
-from .abstract import Executor, CommandResult, Host
+from .abstract import Executor, CommandResult, Host, read_records
 
 
 class LocalExecutor(Executor):
@@ -40,10 +41,54 @@ class LocalExecutor(Executor):
             stderr=stderr,
         )
 
+    async def stream_output(
+        self, command: str, separator: str = "\n", check=True, no_such_file=False
+    ) -> AsyncIterator[str]:
+        logging.debug("stream locally " + colorama.Fore.YELLOW + "$ %s", command)
+        colorama.reinit()
+
+        process = await asyncio.create_subprocess_shell(
+            cmd=command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # In its own process group, so that the whole command can be killed
+            start_new_session=True,
+        )
+        assert process.stdout and process.stderr
+        # Read stderr concurrently so that the command cannot block on a full pipe
+        stderr_task = asyncio.ensure_future(process.stderr.read())
+
+        try:
+            async for record in read_records(process.stdout, separator.encode()):
+                yield record.decode()
+
+            exit_code = await process.wait()
+            stderr = await stderr_task
+        finally:
+            # The consumer stopped iterating before the end of the output
+            if process.returncode is None:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                await process.wait()
+            stderr_task.cancel()
+        logging.debug("Result exit code = '%s'", exit_code)
+        logging.debug("Result stderr = '%s'", stderr)
+        self.check_result(
+            CommandResult(exit_code=exit_code, stdout=b"", stderr=stderr),
+            check=check,
+            no_such_file=no_such_file,
+        )
+
     async def put(self, path, local_path) -> None:
         path = expanduser(path)
         copyfile(local_path, path)
 
+    async def put_content(self, path, content) -> None:
+        with open(expanduser(path), "wb") as f:
+            f.write(content)
+
     @property
     def hostname(self):
         return "local host"
@@ -1,11 +1,12 @@
 import asyncio
 import logging
-from typing import Dict, Optional, Union
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Union
 
 import asyncssh
-from asyncssh import SSHClientConnection, ChannelOpenError
+from asyncssh import SSHClientConnection, SFTPClient, ChannelOpenError
 
-from .abstract import CommandResult, Host
+from .abstract import CommandResult, Host, read_records
 from .abstract import Executor
 
 
@@ -22,14 +23,25 @@ def to_bytes(value: Union[bytes, str, None]) -> bytes:
 class SSHExecutor(Executor):
     connection: SSHClientConnection
     username: str
-
-    def __init__(self, connection: SSHClientConnection, username: str, is_root: bool):
+    sftp_clients: List[SFTPClient]
+    sftp_semaphore: asyncio.Semaphore
+
+    def __init__(
+        self,
+        connection: SSHClientConnection,
+        username: str,
+        is_root: bool,
+        max_sftp_sessions: int = 4,
+    ):
         self.connection = connection
         self.username = username
+        # Idle SFTP clients, at most `max_sftp_sessions` are open at the same time
+        self.sftp_clients = []
+        self.sftp_semaphore = asyncio.Semaphore(max_sftp_sessions)
         super().__init__(is_root=is_root)
 
     async def run(self, command: str, env: Optional[Dict] = None) -> CommandResult:
-        logging.info("run {self.connection} {command}")
+        logging.info("run %s %s", self.connection, command)
 
         # Opening a channel sometimes fails, so this retries a few times until it works.
         for retry in range(5):
@@ -53,16 +65,72 @@ class SSHExecutor(Executor):
             stderr=stderr,
         )
 
-    async def put(self, path, local_path) -> None:
+    async def stream_output(
+        self, command: str, separator: str = "\n", check=True, no_such_file=False
+    ) -> AsyncIterator[str]:
+        logging.info("stream %s %s", self.connection, command)
+
+        # Opening a channel sometimes fails, so this retries a few times until it works.
+        for retry in range(5):
+            try:
+                process = await self.connection.create_process(command, encoding=None)
+                break
+            except ChannelOpenError:
+                logging.debug(f"Retrying {retry}/3")
+                await asyncio.sleep(0)
+
+        async with process:
+            # Read stderr concurrently so that the command cannot block on a full pipe
+            stderr_task = asyncio.ensure_future(process.stderr.read())
+
+            async for record in read_records(process.stdout, separator.encode()):
+                yield record.decode()
+
+            result = await process.wait(check=False)
+            stderr = to_bytes(await stderr_task)
+
+        logging.debug("Result exit code = '%s'", result.exit_status)
+        logging.debug("Result stderr = '%s'", stderr)
+        self.check_result(
+            CommandResult(exit_code=result.exit_status, stdout=b"", stderr=stderr),
+            check=check,
+            no_such_file=no_such_file,
+        )
+
+    def expanduser(self, path: str) -> str:
         if path.startswith("~/"):
             username: str = self.username
             if username == "root":
                 path = "/root/{}".format(path[2:])
             else:
                 path = "/home/{}/{}".format(username, path[2:])
+        return path
 
-        async with self.connection.start_sftp_client() as sftp:
-            await sftp.put(local_path, path)
+    async def put(self, path, local_path) -> None:
+        async with self.sftp() as sftp:
+            await sftp.put(local_path, self.expanduser(path))
+
+    async def put_content(self, path, content) -> None:
+        async with self.sftp() as sftp:
+            async with sftp.open(self.expanduser(path), "wb") as f:
+                await f.write(content)
+
+    @asynccontextmanager
+    async def sftp(self) -> AsyncIterator[SFTPClient]:
+        """Borrow an SFTP client from the pool of this connection, opening a new
+        session only when all existing ones are busy."""
+        async with self.sftp_semaphore:
+            if self.sftp_clients:
+                sftp = self.sftp_clients.pop()
+            else:
+                sftp = await self.connection.start_sftp_client()
+            try:
+                yield sftp
+            except BaseException:
+                # The session may be unusable, do not return it to the pool
+                sftp.exit()
+                raise
+            self.sftp_clients.append(sftp)
 
     @property
     def hostname(self):
@@ -72,9 +140,17 @@ class SSHExecutor(Executor):
 class SSHHost(Host):
     ssh_settings: Dict
     connection: SSHClientConnection
+    max_sftp_sessions: int
+
+    def __init__(self, max_sftp_sessions: int = 4, **kwargs):
+        """
 
-    def __init__(self, **kwargs):
+        :param max_sftp_sessions: Maximum number of concurrent SFTP sessions,
+            must stay below the MaxSessions setting of the SSH server
+        :param kwargs: Arguments passed to asyncssh.connect
+        """
         self.ssh_settings = kwargs
+        self.max_sftp_sessions = max_sftp_sessions
         super().__init__()
 
     async def __aenter__(self) -> SSHExecutor:
@@ -83,6 +159,7 @@ class SSHHost(Host):
             connection=self.connection,
             username=self.ssh_settings["username"],
             is_root=(self.ssh_settings["username"] == "root"),
+            max_sftp_sessions=self.max_sftp_sessions,
         )
 
     async def __aexit__(self, *args, **kwargs):
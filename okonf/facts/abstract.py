@@ -1,7 +1,7 @@
+import asyncio
 import logging
 from abc import abstractmethod
-from collections.abc import Iterable
-from typing import List, Union, Tuple
+from typing import Any, Iterator, List, Type, TypeVar, Union, Tuple
 
 import colorama
 from colorama import Fore
@@ -9,101 +9,121 @@ from colorama import Fore
 from ..connectors.abstract import Executor
 
 
+def flatten(iterable) -> Iterator:
+    """Iterate over the elements of nested lists and tuples, without recursion.
+    Other iterables such as strings are yielded as single elements."""
+    stack = [iter(iterable)]
+    while stack:
+        for element in stack[-1]:
+            if isinstance(element, (list, tuple)):
+                stack.append(iter(element))
+                break
+            yield element
+        else:
+            stack.pop()
+
+
 def all_true(iterable) -> bool:
     """Recursive version of the all() function"""
-    for element in iterable:
-        if isinstance(element, Iterable):
-            if not all_true(element):
-                return False
-        elif not element:
-            return False
-        else:
-            pass
-    return True
+    return all(flatten(iterable))
 
 
 def any_true(iterable) -> bool:
-    """Recursive version of the all() function"""
-    for element in iterable:
-        if isinstance(element, Iterable):
-            if not any_true(element):
-                return True
-        elif element:
-            return True
-    return False
+    """Recursive version of the any() function"""
+    return any(flatten(iterable))
 
 
 def all_stateless(iterable) -> bool:
     """Recursive check that all facts are either unchanged or stateless"""
-    for element in iterable:
-        if isinstance(element, Iterable):
-            if not all_stateless(element):
-                return False
-        elif not (element or element.fact.is_stateless):
-            return False
-        else:
-            pass
-    return True
+    return all(element or element.fact.is_stateless for element in flatten(iterable))
 
 
 class FactCheck:
+    __slots__ = ("fact", "result", "hostname", "_bool")
+
     fact: "Fact"
-    result: Union[bool, Tuple]
+    result: Union[bool, Tuple, List]
     hostname: str
+    _bool: bool
 
     def __init__(
-        self, fact: "Fact", result: Union[bool, Tuple], host: Executor
+        self, fact: "Fact", result: Union[bool, Tuple, List], host: Executor
     ) -> None:
-        assert isinstance(result, bool) or isinstance(result, list)
         self.fact = fact
         self.result = result
         self.hostname = host.hostname
+        # The result does not change after construction, so it is only evaluated once
+        if isinstance(result, bool):
+            self._bool = result
+        else:
+            self._bool = all_stateless(result)
 
     def __bool__(self) -> bool:
-        if isinstance(self.result, bool):
-            return self.result
-        else:
-            return all_stateless(self.result)
+        return self._bool
 
     def __eq__(self, other) -> bool:
+        if isinstance(other, bool):
+            return self._bool is other
+        if isinstance(other, FactCheck):
+            return self.fact is other.fact and self._bool is other._bool
         return self.result == other
 
+    def __hash__(self) -> int:
+        return hash((id(self.fact), self._bool))
+
     def __repr__(self) -> str:
         if self.fact.is_stateless:
-            return "{}{} {}{}".format(Fore.YELLOW, "Stateless", Fore.WHITE, self.fact)
+            return f"{Fore.YELLOW}Stateless {Fore.WHITE}{self.fact}"
         if bool(self):
-            return "{}{} {}{}".format(Fore.GREEN, "Present", Fore.WHITE, self.fact)
+            return f"{Fore.GREEN}Present {Fore.WHITE}{self.fact}"
         else:
-            return "{}{} {}{}".format(Fore.RED, "Absent", Fore.WHITE, self.fact)
+            return f"{Fore.RED}Absent {Fore.WHITE}{self.fact}"
 
 
 class FactResult:
+    __slots__ = ("fact", "result", "hostname", "_bool")
+
     def __init__(
         self, fact: "Fact", result: Union[bool, Tuple, List], host: Executor
     ) -> None:
-        assert isinstance(result, bool) or isinstance(result, list)
         self.fact = fact
         self.result = result
         self.hostname = host.hostname
+        if isinstance(result, bool):
+            self._bool = result
+        else:
+            self._bool = any_true(result)
 
     def __bool__(self) -> bool:
-        if isinstance(self.result, bool):
-            return self.result
-        else:
-            return any_true(self.result)
+        return self._bool
 
     def __eq__(self, other) -> bool:
+        if isinstance(other, bool):
+            return self._bool is other
+        if isinstance(other, FactResult):
+            return self.fact is other.fact and self._bool is other._bool
         return self.result == other
 
+    def __hash__(self) -> int:
+        return hash((id(self.fact), self._bool))
+
     def __repr__(self) -> str:
         if bool(self):
-            return "{}{} {}{}".format(Fore.YELLOW, "Changed", Fore.WHITE, self.fact)
+            return f"{Fore.YELLOW}Changed {Fore.WHITE}{self.fact}"
         else:
-            return "{}{} {}{}".format(Fore.MAGENTA, "Unchanged", Fore.WHITE, self.fact)
+            return f"{Fore.MAGENTA}Unchanged {Fore.WHITE}{self.fact}"
+
+
+F = TypeVar("F", bound="Fact")
 
 
 class Fact:
+    # Subclasses declare the slots of their own attributes
+    __slots__ = ("_description_cache", "_str_cache")
+
     is_stateless: bool = False
+    _description_cache: str
+    _str_cache: str
 
     @abstractmethod
     async def enquire(self, host: Executor) -> bool:
@@ -117,7 +137,7 @@ class Fact:
 
     async def check(self, host: Executor) -> FactCheck:
         result = FactCheck(self, await self.enquire(host), host)
-        logging.info(str(result))
+        logging.info("%s", result)
         return result
 
     async def apply(self, host: Executor) -> FactResult:
@@ -126,18 +146,64 @@ class Fact:
             result = FactResult(self, await self.enforce(host), host)
         else:
             result = FactResult(self, False, host)
-        logging.info(str(result))
+        logging.info("%s", result)
         return result
 
+    @classmethod
+    async def check_many(
+        cls: Type[F], host: Executor, facts: List[F]
+    ) -> List[FactCheck]:
+        """Check multiple facts of this class. Subclasses can override this to
+        inspect the host using fewer commands."""
+        return list(await asyncio.gather(*(fact.check(host) for fact in facts)))
+
+    @classmethod
+    async def apply_many(
+        cls: Type[F], host: Executor, facts: List[F]
+    ) -> List[FactResult]:
+        """Apply multiple facts of this class concurrently. Subclasses can
+        override this to enforce them using fewer commands."""
+        return list(await asyncio.gather(*(fact.apply(host) for fact in facts)))
+
+    def _attributes(self) -> Iterator[Tuple[str, Any]]:
+        """Attributes of the fact, whether stored in slots or in a __dict__."""
+        for cls in reversed(type(self).__mro__):
+            for name in cls.__dict__.get("__slots__", ()):
+                if hasattr(self, name):
+                    yield name, getattr(self, name)
+        yield from getattr(self, "__dict__", {}).items()
+
     @property
     def description(self) -> str:
-        return str(self.__dict__)
+        return str({key: value for key, value in self._attributes() if key[0] != "_"})
+
+    def cached_description(self) -> str:
+        """The description, computed once since facts are not modified once
+        created. Facts modified afterwards must call `clear_cache`."""
+        try:
+            return self._description_cache
+        except AttributeError:
+            self._description_cache = str(self.description)
+            return self._description_cache
+
+    def clear_cache(self) -> None:
+        """Forget the cached description and string of the fact."""
+        for name in ("_description_cache", "_str_cache"):
+            try:
+                delattr(self, name)
+            except AttributeError:
+                pass
 
     def __str__(self) -> str:
+        try:
+            return self._str_cache
+        except AttributeError:
+            pass
         arguments = (
-            colorama.Fore.CYAN + str(self.description) + colorama.Style.RESET_ALL
+            colorama.Fore.CYAN + self.cached_description() + colorama.Style.RESET_ALL
         )
-        return " ".join((self.__class__.__name__, arguments))
+        self._str_cache = " ".join((self.__class__.__name__, arguments))
+        return self._str_cache
 
     def __repr__(self) -> str:
-        return "<{}[{}]>".format(self.__class__.__name__, self.description)
+        return f"<{self.__class__.__name__}[{self.cached_description()}]>"
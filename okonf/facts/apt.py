@@ -1,34 +1,41 @@
+import logging
 import re
-from typing import Iterable, Dict, Tuple, Union, Optional
+import shlex
+from typing import Iterable, Dict, List, Tuple, Union, Optional
 from pathlib import Path
 
-from .abstract import Fact
+from .abstract import Fact, FactCheck, FactResult
 from ..connectors.abstract import Executor
+from ..utils import quote_path
 
 RE_UPGRADEABLE = (
-    r"([^\/]+)\/([^\s]+)\s+([^\s]+)\s+(\w+)\s+" r"\[upgradable from:\s+([^\s]+)\]$"
+    r"^([^\/\s]+)\/([^\s]+)\s+([^\s]+)\s+(\w+)\s+" r"\[upgradable from:\s+([^\s]+)\]$"
 )
+# Matches all lines of the output at once
+_RE_UPGRADEABLE = re.compile(RE_UPGRADEABLE, re.MULTILINE)
+
+DPKG_INSTALLED = "install ok installed"
 
 
 def parse_upgradeable(
-    lines: Iterable[str],
+    text: str,
 ) -> Iterable[Tuple[str, Dict[str, Union[str, int]]]]:
-    for line in lines:
-        match = re.match(RE_UPGRADEABLE, line)
-        if match:
-            name, source, next_version, arch, version = match.groups()
-            yield name, {
-                "source": source,
-                "next_version": next_version,
-                "arch": arch,
-                "version": version,
-            }
+    for match in _RE_UPGRADEABLE.finditer(text):
+        name, source, next_version, arch, version = match.groups()
+        yield name, {
+            "source": source,
+            "next_version": next_version,
+            "arch": arch,
+            "version": version,
+        }
 
 
 class AptPresent(Fact):
+    __slots__ = ("name", "version", "path")
+
     name: str
-    version: Optional[str] = None
-    path: Optional[Path] = None
+    version: Optional[str]
+    path: Optional[Path]
 
     def __init__(
         self, name: str, version: Optional[str] = None, path: Optional[Path] = None
@@ -37,24 +44,89 @@ class AptPresent(Fact):
         self.version = version
         self.path = path
 
-    async def enquire(self, host: Executor) -> bool:
-        status = await host.check_output("dpkg -l {}".format(self.name), check=False)
-        version = self.version or ""
+    @classmethod
+    async def enquire_many(
+        cls, host: Executor, names: Iterable[str]
+    ) -> Dict[str, Optional[str]]:
+        """Query the state of multiple packages with a single dpkg-query call,
+        return the installed version of each package or None if not installed."""
+        names = list(names)
+        result: Dict[str, Optional[str]] = {
+            name.split(":", 1)[0]: None for name in names
+        }
+        if not names:
+            return result
+
+        dpkg_format = "'${Package} ${Version} ${Status}\\n'"
+        quoted = " ".join(shlex.quote(name) for name in names)
+        status = await host.check_output(
+            f"dpkg-query -W -f={dpkg_format} {quoted} 2>/dev/null", check=False
+        )
         for line in status.split("\n"):
-            if re.match(r"ii\s+{}(:amd64)?\s+{}\s+".format(self.name, version), line):
-                return True
-        return False
+            if not line:
+                continue
+            package, version, state = line.split(" ", 2)
+            if state == DPKG_INSTALLED:
+                result[package] = version
+        return result
+
+    def matches(self, installed: Dict[str, Optional[str]]) -> bool:
+        """Whether the fact is in place given the result of `enquire_many`."""
+        version = installed.get(self.name.split(":", 1)[0])
+        if version is None:
+            return False
+        return not self.version or version == self.version
+
+    async def enquire(self, host: Executor) -> bool:
+        return self.matches(await self.enquire_many(host, [self.name]))
 
     async def enforce(self, host: Executor) -> bool:
-        name = self.path or self.name
+        return await self.enforce_many(host, [self])
+
+    @classmethod
+    async def enforce_many(cls, host: Executor, facts: List["AptPresent"]) -> bool:
+        names = " ".join(
+            quote_path(str(fact.path)) if fact.path else shlex.quote(fact.name)
+            for fact in facts
+        )
         async with host.lock("apt"):
             if host.is_root:
-                await host.check_output("apt-get install -y {}".format(name))
+                await host.check_output(f"apt-get install -y {names}")
             else:
-                await host.check_output("sudo apt-get install -y {}".format(name))
+                await host.check_output(f"sudo apt-get install -y {names}")
 
         return True
 
+    @classmethod
+    async def check_many(
+        cls, host: Executor, facts: List["AptPresent"]
+    ) -> List[FactCheck]:
+        """Check all packages with a single dpkg-query call."""
+        installed = await cls.enquire_many(host, [fact.name for fact in facts])
+        results = []
+        for fact in facts:
+            result = FactCheck(fact, fact.matches(installed), host)
+            logging.info("%s", result)
+            results.append(result)
+        return results
+
+    @classmethod
+    async def apply_many(
+        cls, host: Executor, facts: List["AptPresent"]
+    ) -> List[FactResult]:
+        """Enforce all facts that are not in place yet with a single apt-get call."""
+        checks = await cls.check_many(host, facts)
+        missing = [fact for fact, check in zip(facts, checks) if not check]
+        if missing:
+            await cls.enforce_many(host, missing)
+
+        results = []
+        for fact, check in zip(facts, checks):
+            result = FactResult(fact, not check, host)
+            logging.info("%s", result)
+            results.append(result)
+        return results
+
     @property
     def description(self) -> str:
         result = self.name
@@ -66,30 +138,40 @@ class AptPresent(Fact):
 
 
 class AptAbsent(AptPresent):
+    __slots__ = ("purge",)
+
     purge: bool
 
     def __init__(self, name: str, purge: bool = False, sudo: bool = True):
         self.purge = purge
         super(AptAbsent, self).__init__(name=name)
 
-    async def enquire(self, host: Executor) -> bool:
-        return not await super().enquire(host)
-
-    async def enforce(self, host: Executor) -> bool:
-        purge = "--purge" if self.purge else ""
-        async with host.lock("apt"):
-            if host.is_root:
-                await host.check_output(
-                    "apt-get remove {} -y {}".format(purge, self.name)
-                )
-            else:
-                await host.check_output(
-                    "sudo apt-get remove {} -y {}".format(purge, self.name)
-                )
+    def matches(self, installed: Dict[str, Optional[str]]) -> bool:
+        return not super().matches(installed)
+
+    @classmethod
+    async def enforce_many(cls, host: Executor, facts: List["AptPresent"]) -> bool:
+        # Packages to purge and to remove require different options
+        for purge in (False, True):
+            names = " ".join(
+                shlex.quote(fact.name)
+                for fact in facts
+                if isinstance(fact, AptAbsent) and fact.purge == purge
+            )
+            if not names:
+                continue
+            option = "--purge" if purge else ""
+            async with host.lock("apt"):
+                if host.is_root:
+                    await host.check_output(f"apt-get remove {option} -y {names}")
+                else:
+                    await host.check_output(f"sudo apt-get remove {option} -y {names}")
         return True
 
 
 class AptUpdated(Fact):
+    __slots__ = ("names",)
+
     is_stateless = True
 
     def __init__(self, names=tuple()):
@@ -99,25 +181,46 @@ class AptUpdated(Fact):
         return False
 
     async def enforce(self, host: Executor) -> bool:
+        # Number of `apt-get update` started on the host so far
+        requested = host.counters.get("apt-update", 0)
         async with host.lock("apt-update"):
+            # An update started after this one was requested has completed
+            # while waiting for the lock, so it does not need to run again.
+            if host.counters.get("apt-update", 0) > requested:
+                return False
+            host.counters["apt-update"] = requested + 1
             await host.check_output("sudo apt-get update")
         return True
 
+    @classmethod
+    async def apply_many(
+        cls, host: Executor, facts: List["AptUpdated"]
+    ) -> List[FactResult]:
+        """Facts of a collection are not ordered, so one update serves them all."""
+        results = [await facts[0].apply(host)]
+        for fact in facts[1:]:
+            result = FactResult(fact, False, host)
+            logging.info("%s", result)
+            results.append(result)
+        return results
+
 
 class AptUpgraded(Fact):
+    __slots__ = ("names",)
+
     names: Iterable
 
     def __init__(self, names: Optional[Iterable] = None):
         self.names = names or tuple()
 
     async def info(self, host: Executor) -> Dict:
-        names_str = " ".join(self.names)
-        status = await host.check_output("apt list --upgradeable {}".format(names_str))
+        names_str = " ".join(shlex.quote(name) for name in self.names)
+        status = await host.check_output(f"apt list --upgradeable {names_str}")
 
         if status.startswith("Listing...\n"):
             status = status[len("Listing...\n") :]
 
-        return {name: values for name, values in parse_upgradeable(status.split("\n"))}
+        return {name: values for name, values in parse_upgradeable(status)}
 
     async def enquire(self, host: Executor) -> bool:
         upgradeable = await self.info(host)
@@ -1,20 +1,41 @@
+import asyncio
+import logging
 import os
+import re
 from abc import ABC
 from hashlib import sha256
 from os.path import join
-from tempfile import NamedTemporaryFile
-from typing import Optional, Union
+from typing import Dict, Optional, Set, Tuple, Union
 
 from .abstract import Fact, FactCheck, FactResult
 from .multiple import Collection, Sequence
 from ..connectors.abstract import Executor
-from ..utils import get_local_file_hash
-from ..connectors.exceptions import NoSuchFileError
+from ..utils import get_local_file_hash, quote_path, scan_local_directory
+from ..connectors.exceptions import NoSuchFileError, ShellError
+
+# Value of `FileCopy.remote_hash` for files known to be absent from the host
+_REMOTE_ABSENT = object()
+
+
+def _unescape_sha256sum(name: str) -> str:
+    """Name of a file in the output of sha256sum, which escapes backslashes and
+    newlines in names and marks such lines with a leading backslash."""
+    escapes = {"n": "\n", "r": "\r"}
+    return re.sub(r"\\(.)", lambda match: escapes.get(match[1], match[1]), name)
+
+
+def _to_digest(hash: Union[bytes, str]) -> bytes:
+    """Raw sha256 digest from either its raw or its hexadecimal form."""
+    if isinstance(hash, str):
+        return bytes.fromhex(hash)
+    return bytes.fromhex(hash.decode()) if len(hash) == 64 else hash
 
 
 class PathPresent(Fact, ABC):
     """Abstract class containing methods common to FilePresent and DirectoryPresent."""
 
+    __slots__ = ("remote_path", "mode_int", "symbolic_link", "present")
+
     remote_path: str
     mode_int: Optional[int]
     symbolic_link: bool
@@ -31,13 +52,24 @@ class PathPresent(Fact, ABC):
         remote_path: str,
         mode: Optional[Union[int, str]] = None,
         symbolic_link: bool = True,
+        present: Optional[bool] = None,
     ) -> None:
+        """
+
+        :param remote_path:
+        :param mode:
+        :param symbolic_link: Accept a symbolic link instead of the path type
+        :param present: Optional, whether the path is known to be present
+        """
         self.mode_int = int(mode, base=8) if isinstance(mode, str) else mode
         self.remote_path = remote_path
         self.symbolic_link = symbolic_link
+        self.present = present
 
     async def enquire(self, host: Executor) -> bool:
-        command = f'stat -c "%a %F" {self.remote_path}'
+        if self.present is not None:
+            return self.present
+        command = f'stat -c "%a %F" {quote_path(self.remote_path)}'
         try:
             result = await host.check_output(command, no_such_file=True)
             mode, type_ = result.split(" ", 1)
@@ -60,6 +92,8 @@ class PathPresent(Fact, ABC):
 class FilePresent(PathPresent):
     """Ensure that a file is present"""
 
+    __slots__ = ()
+
     @property
     def accepted_types(self):
         if self.symbolic_link:
@@ -68,41 +102,53 @@ class FilePresent(PathPresent):
             return "regular empty file", "regular file"
 
     async def enforce(self, host: Executor) -> bool:
-        await host.check_output("touch {}".format(self.remote_path))
+        remote_path = quote_path(self.remote_path)
+        await host.check_output(f"touch {remote_path}")
         if self.mode:
-            await host.check_output(f"chmod {self.mode} {self.remote_path}")
+            await host.check_output(f"chmod {self.mode} {remote_path}")
         return True
 
 
 class FileAbsent(FilePresent):
     """Ensure that a file is absent"""
 
+    __slots__ = ()
+
     async def enquire(self, host: Executor) -> bool:
         return not await FilePresent.enquire(self, host)
 
     async def enforce(self, host: Executor) -> bool:
-        await host.check_output("rm {}".format(self.remote_path))
+        await host.check_output(f"rm {quote_path(self.remote_path)}")
         return True
 
 
 class FileHash(Fact):
     """Ensure that a file has a given hash"""
 
+    __slots__ = ("remote_path", "hash")
+
     remote_path: str
     hash: bytes
 
     def __init__(self, remote_path: str, hash: bytes):
+        """
+
+        :param remote_path:
+        :param hash: sha256 digest of the file, raw or hexadecimal
+        """
         self.remote_path = remote_path
-        self.hash = hash
+        # Hashes are compared as raw digests, half the size of their hex form
+        self.hash = _to_digest(hash)
 
     async def get_hash(self, host: Executor):
         try:
             output = await host.check_output(
-                "sha256sum {}".format(self.remote_path), no_such_file=True
+                f"sha256sum {quote_path(self.remote_path)}", no_such_file=True
             )
         except NoSuchFileError:
             return False
-        return output.split(" ", 1)[0].encode()
+        # sha256sum prefixes the hash with a backslash for escaped file names
+        return bytes.fromhex(output.split(" ", 1)[0].lstrip("\\"))
 
     async def enquire(self, host: Executor) -> bool:
         remote_hash = await self.get_hash(host)
@@ -115,19 +161,40 @@ class FileHash(Fact):
 class FileCopy(Fact):
     """Ensure that a file is a copy of a local file"""
 
+    __slots__ = ("remote_path", "local_path", "remote_hash", "_local_hash")
+
+    _local_hash: Optional[Tuple[Tuple[int, int], bytes]]
+
     def __init__(self, remote_path, local_path, remote_hash=None):
         """
 
         :param remote_path:
         :param local_path:
-        :param remote_hash: Optional, hash of the remote file if known
+        :param remote_hash: Optional, sha256 digest of the remote file if known,
+            raw or hexadecimal, or _REMOTE_ABSENT if the remote file is known
+            to be absent
         """
         self.remote_path = remote_path
         self.local_path = local_path
-        self.remote_hash = remote_hash
+        if remote_hash is None or remote_hash is _REMOTE_ABSENT:
+            self.remote_hash = remote_hash
+        else:
+            self.remote_hash = _to_digest(remote_hash)
+        self._local_hash = None
+
+    async def get_local_hash(self) -> bytes:
+        """Hash of the local file, reused as long as its modification time
+        and size do not change."""
+        stat = os.stat(self.local_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if self._local_hash is None or self._local_hash[0] != key:
+            self._local_hash = (key, await get_local_file_hash(self.local_path))
+        return self._local_hash[1]
 
     async def enquire(self, host: Executor) -> bool:
-        local_hash = await get_local_file_hash(self.local_path)
+        if self.remote_hash is _REMOTE_ABSENT:
+            return False
+        local_hash = await self.get_local_hash()
         if self.remote_hash:
             return local_hash == self.remote_hash
         else:
@@ -145,29 +212,30 @@ class FileCopy(Fact):
 class FileContent(Fact):
     """Ensure that a file has a given content"""
 
+    __slots__ = ("remote_path", "content", "_content_hash")
+
     def __init__(self, remote_path, content):
         self.remote_path = remote_path
         self.content = content
+        self._content_hash = sha256(content).digest()
 
     async def check(self, host: Executor):
-        content_hash = sha256(self.content).hexdigest().encode()
-        return await FileHash(self.remote_path, content_hash).check(host)
+        return await FileHash(self.remote_path, self._content_hash).check(host)
 
     async def enforce(self, host: Executor):
-        with NamedTemporaryFile() as tmpfile:
-            tmpfile.write(self.content)
-            tmpfile.seek(0)
-            await host.put(self.remote_path, tmpfile.name)
+        await host.put_content(self.remote_path, self.content)
         return True
 
     @property
     def description(self) -> str:
-        return '{"remote_path": self.remote_path, "content": ...}'
+        return f'{{"remote_path": "{self.remote_path}", "content": ...}}'
 
 
 class DirectoryPresent(PathPresent):
     """Ensure that a directory is present"""
 
+    __slots__ = ()
+
     @property
     def accepted_types(self):
         if self.symbolic_link:
@@ -176,123 +244,199 @@ class DirectoryPresent(PathPresent):
             return "directory"
 
     async def enforce(self, host: Executor) -> bool:
+        remote_path = quote_path(self.remote_path)
         if self.mode:
-            await host.check_output(
-                f"mkdir --mode={self.mode} --parents {self.remote_path}"
-            )
+            await host.check_output(f"mkdir --mode={self.mode} --parents {remote_path}")
             # The mode is enforced in a second step since the mode of an existing directory will not be changed.
-            await host.check_output(f"chmod {self.mode} {self.remote_path}")
+            await host.check_output(f"chmod {self.mode} {remote_path}")
         else:
-            await host.check_output(f"mkdir --parents {self.remote_path}")
+            await host.check_output(f"mkdir --parents {remote_path}")
         return True
 
 
 class DirectoryAbsent(DirectoryPresent):
     """Ensure that a directory is absent"""
 
+    __slots__ = ("recursive", "force")
+
     recursive: bool
     force: bool
 
     def __init__(
-        self, remote_path: str, recursive: bool = False, force: bool = False
+        self,
+        remote_path: str,
+        recursive: bool = False,
+        force: bool = False,
+        present: Optional[bool] = None,
     ) -> None:
         self.recursive = recursive
         self.force = force
-        super().__init__(remote_path)
+        super().__init__(remote_path, present=present)
 
     async def enquire(self, host: Executor) -> bool:
         return not await DirectoryPresent.enquire(self, host)
 
     async def enforce(self, host: Executor) -> bool:
+        remote_path = quote_path(self.remote_path)
         if self.force:
             recursive = "--recursive" if self.recursive else ""
             force = "--force" if self.force else ""
-            await host.check_output(f"rm {recursive} {force} {self.remote_path}")
+            await host.check_output(f"rm {recursive} {force} {remote_path}")
         else:
-            await host.check_output("rmdir {}".format(self.remote_path))
+            await host.check_output(f"rmdir {remote_path}")
         return True
 
 
 class DirectoryCopy(Fact):
     """Ensure that a remote directory contains a copy of a local one"""
 
-    def __init__(self, remote_path: str, local_path: str, delete: bool = False) -> None:
+    __slots__ = ("remote_path", "local_path", "delete", "fingerprint")
+
+    def __init__(
+        self,
+        remote_path: str,
+        local_path: str,
+        delete: bool = False,
+        fingerprint: bool = False,
+    ) -> None:
+        """
+
+        :param remote_path:
+        :param local_path:
+        :param delete: Remove remote files and directories absent locally
+        :param fingerprint: Compare a fingerprint of both directories first,
+            and skip checking each file when they are identical
+        """
         self.remote_path = remote_path
         self.local_path = local_path
         self.delete = delete
+        self.fingerprint = fingerprint
 
-    async def info_files_hash(self, host: Executor) -> dict:
-        try:
-            command = "find %s -type f -exec sha256sum {} +" % self.remote_path
-            output = await host.check_output(command, no_such_file=True)
-            result = {}
-            for line in output.strip().split("\n"):
-                if not line:
-                    continue
-                hash, path = line.split()
-                result[path] = hash.encode()
-            return result
-        except NoSuchFileError:
-            return {}
+    async def info_remote(self, host: Executor) -> Tuple[Dict[str, bytes], Set[str]]:
+        """Fetch the hash of all remote files and the list of remote directories
+        using a single command, parsing its output as it is received.
 
-    async def info_dirs_present(self, host: Executor):
+        Paths are relative to the remote directory, which is listed as "".
+        Nothing is listed if the remote directory does not exist."""
         try:
-            command = "find {} -type d".format(self.remote_path)
-            output = await host.check_output(command, no_such_file=True)
-            result = output.strip().split("\n")
-            return result if result != [""] else []
-        except NoSuchFileError:
-            return []
-
-    def _get_remote_path(self, local_path):
+            return await self._list_remote(host, separator="\0")
+        except ShellError as error:
+            # `sha256sum --zero` requires coreutils 8.30, older versions reject it
+            if b"zero" not in error.stderr:
+                raise
+        return await self._list_remote(host, separator="\n")
+
+    async def _list_remote(
+        self, host: Executor, separator: str
+    ) -> Tuple[Dict[str, bytes], Set[str]]:
+        # The listing runs from the remote directory so that its paths do not
+        # depend on how the shell expands the remote path, for example `~/`.
+        # Symbolic links to files are hashed, the local scan lists them as files.
+        # Directories are prefixed with "d " to distinguish them from the hashes.
+        # Records are separated by NUL characters, which cannot be part of paths.
+        # Without --zero they are separated by newlines, which sha256sum escapes
+        # in the names of files but find does not in the names of directories.
+        remote_path = quote_path(self.remote_path)
+        zero = " --zero" if separator == "\0" else ""
+        printf_separator = "\\0" if separator == "\0" else "\\n"
+        command = (
+            "[ -d %s ] || exit 0; cd %s && "
+            "find . \\( -xtype f -exec sha256sum%s {} + \\) "
+            "-o \\( -type d -printf 'd %%P%s' \\)"
+            % (remote_path, remote_path, zero, printf_separator)
+        )
+        files: Dict[str, bytes] = {}
+        dirs: Set[str] = set()
+        async for record in host.stream_output(command, separator=separator):
+            if record.startswith("d "):
+                dirs.add(record[2:])
+            else:
+                hash, path = record.split("  ", 1)
+                if hash.startswith("\\"):
+                    hash, path = hash[1:], _unescape_sha256sum(path)
+                # Files are listed by find as "./path"
+                files[path[2:]] = bytes.fromhex(hash)
+        return files, dirs
+
+    def _get_relative_path(self, local_path: str) -> str:
         assert local_path.startswith(self.local_path)
-        rel_path = local_path[len(self.local_path) :].strip("/")
-        return join(self.remote_path, rel_path)
-
-    def _get_local_path(self, remote_path):
-        assert remote_path.startswith(self.remote_path)
-        rel_path = remote_path[len(self.remote_path) :].strip("/")
-        return join(self.local_path, rel_path)
+        return local_path[len(self.local_path) :].strip("/")
+
+    def _get_remote_path(self, rel_path: str) -> str:
+        return join(self.remote_path, rel_path) if rel_path else self.remote_path
+
+    @staticmethod
+    def _is_below_root(rel_path: str) -> bool:
+        """Whether a listed path is strictly inside the remote directory,
+        so that it can be removed."""
+        return (
+            bool(rel_path)
+            and not os.path.isabs(rel_path)
+            and ".." not in rel_path.split("/")
+        )
 
     async def subfacts(self, host: Executor):
         """This fact can be defined entirely using other facts, so
         we return a structure with these facts that can be used for both
         check and apply instead of running code."""
 
-        dirs_to_create = [DirectoryPresent(self._get_remote_path(self.local_path))]
+        # The local directory is scanned in a thread while the host is queried
+        loop = asyncio.get_event_loop()
+        remote_info, local_info = await asyncio.gather(
+            self.info_remote(host),
+            loop.run_in_executor(None, scan_local_directory, self.local_path),
+        )
+        existing_files, existing_dirs = remote_info
+        local_dirs, local_files = local_info
+
+        dirs_to_create = []
         files_to_copy = []
         dirs_to_remove = []
         files_to_remove = []
 
-        existing_files = await self.info_files_hash(host)
-
-        for root, dirs, files in os.walk(self.local_path):
-            remote_root = self._get_remote_path(root)
+        # Paths expected from the local directory, relative to the remote one
+        expected_dirs = set()
+        expected_files = set()
+
+        for local_path in [self.local_path] + local_dirs:
+            rel_path = self._get_relative_path(local_path)
+            expected_dirs.add(rel_path)
+            dirs_to_create.append(
+                DirectoryPresent(
+                    self._get_remote_path(rel_path),
+                    # Paths missing from the listing may still be symbolic links
+                    present=True if rel_path in existing_dirs else None,
+                )
+            )
 
-            for dirname in dirs:
-                dirs_to_create.append(DirectoryPresent(join(remote_root, dirname)))
+        for local_path in local_files:
+            rel_path = self._get_relative_path(local_path)
+            expected_files.add(rel_path)
+            remote_hash: object
+            if rel_path in existing_files:
+                remote_hash = existing_files[rel_path]
+            elif os.path.dirname(rel_path) in existing_dirs:
+                remote_hash = _REMOTE_ABSENT
+            else:
+                # The parent directory may be a symbolic link, which is not
+                # followed by the listing, so the file is hashed on its own
+                remote_hash = None
+            files_to_copy.append(
+                FileCopy(self._get_remote_path(rel_path), local_path, remote_hash)
+            )
 
-            for filename in files:
-                remote_path = join(remote_root, filename)
-                files_to_copy.append(
-                    FileCopy(
-                        remote_path,
-                        join(root, filename),
-                        remote_hash=existing_files.get(remote_path),
+        if self.delete:
+            for rel_path in existing_files:
+                if rel_path not in expected_files and self._is_below_root(rel_path):
+                    files_to_remove.append(
+                        FileAbsent(self._get_remote_path(rel_path), present=True)
                     )
-                )
 
-        if self.delete:
-            for filepath in existing_files:
-                local_path = self._get_local_path(filepath)
-                if not os.path.isfile(local_path):
-                    files_to_remove.append(FileAbsent(filepath))
-
-            existing_dirs = await self.info_dirs_present(host)
-            for dirname in existing_dirs:
-                local_path = self._get_local_path(dirname)
-                if not os.path.isdir(local_path):
-                    dirs_to_remove.append(DirectoryAbsent(dirname))
+            for rel_path in existing_dirs:
+                if rel_path not in expected_dirs and self._is_below_root(rel_path):
+                    dirs_to_remove.append(
+                        DirectoryAbsent(self._get_remote_path(rel_path), present=True)
+                    )
         else:
             files_to_remove = []
             dirs_to_remove = []
@@ -321,10 +465,59 @@ class DirectoryCopy(Fact):
             title=f"Directory copy from {self.local_path} to {self.remote_path}",
         )
 
+    async def local_fingerprint(self) -> bytes:
+        """Hash of the sorted records of all local files and directories,
+        formatted like the output of `remote_fingerprint`."""
+        loop = asyncio.get_event_loop()
+        local_dirs, local_files = await loop.run_in_executor(
+            None, scan_local_directory, self.local_path
+        )
+        hashes = await asyncio.gather(*(get_local_file_hash(p) for p in local_files))
+
+        def relative(path: str) -> bytes:
+            rel_path = path[len(self.local_path) :].strip("/")
+            return os.fsencode("./" + rel_path if rel_path else ".")
+
+        records = [b"d " + relative(path) for path in [self.local_path] + local_dirs]
+        records += [
+            hash.hex().encode() + b"  " + relative(path)
+            for path, hash in zip(local_files, hashes)
+        ]
+        return sha256(b"".join(record + b"\0" for record in sorted(records))).digest()
+
+    async def remote_fingerprint(self, host: Executor) -> Optional[bytes]:
+        """Hash of the sorted records of all remote files and directories,
+        or None if the remote directory cannot be listed."""
+        command = (
+            "cd %s && find . \\( -xtype f -exec sha256sum --zero {} + \\) "
+            "-o \\( -type d -printf 'd %%p\\0' \\) | LC_ALL=C sort -z | sha256sum"
+            % quote_path(self.remote_path)
+        )
+        result = await host.run(command)
+        if result.exit_code:
+            return None
+        return bytes.fromhex(result.stdout.decode().split(" ", 1)[0])
+
+    async def in_sync(self, host: Executor) -> bool:
+        """Whether the remote directory is known to be identical to the local one,
+        using a single remote command."""
+        local, remote = await asyncio.gather(
+            self.local_fingerprint(), self.remote_fingerprint(host)
+        )
+        return local == remote
+
     async def check(self, host: Executor) -> FactCheck:
+        if self.fingerprint and await self.in_sync(host):
+            result = FactCheck(self, True, host)
+            logging.info("%s", result)
+            return result
         facts = await self.subfacts(host)
         return await facts.check(host)
 
     async def apply(self, host: Executor) -> FactResult:
+        if self.fingerprint and await self.in_sync(host):
+            result = FactResult(self, False, host)
+            logging.info("%s", result)
+            return result
         facts = await self.subfacts(host)
         return await facts.apply(host)
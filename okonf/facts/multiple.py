@@ -1,5 +1,5 @@
 import asyncio
-from typing import Union, Any
+from typing import Any, Dict, List, Type, Union
 
 from .abstract import Fact, FactCheck, FactResult
 from ..connectors.abstract import Executor
@@ -11,6 +11,8 @@ class Collection(Fact):
     asynchronously.
     """
 
+    __slots__ = ("facts", "title")
+
     facts: Any
     title: str
 
@@ -25,13 +27,34 @@ class Collection(Fact):
         :param host:
         :return:
         """
-        result = await asyncio.gather(*(step.check(host) for step in self.facts))
+        result = await self._gather_by_type("check_many", host)
         return FactCheck(fact=self, result=result, host=host)
 
     async def apply(self, host: Executor) -> FactResult:
-        result = await asyncio.gather(*(step.apply(host) for step in self.facts))
+        result = await self._gather_by_type("apply_many", host)
         return FactResult(fact=self, result=result, host=host)
 
+    async def _gather_by_type(self, method: str, host: Executor) -> List:
+        """Run `check_many` or `apply_many` concurrently for each class of facts,
+        so that facts of the same class can share commands on the host.
+        Results are returned in the order of the facts."""
+        groups: Dict[Type[Fact], List[int]] = {}
+        for index, step in enumerate(self.facts):
+            groups.setdefault(type(step), []).append(index)
+
+        groups_results = await asyncio.gather(
+            *(
+                getattr(fact_type, method)(host, [self.facts[i] for i in indices])
+                for fact_type, indices in groups.items()
+            )
+        )
+
+        result: List = [None] * len(self.facts)
+        for indices, group_results in zip(groups.values(), groups_results):
+            for index, step_result in zip(indices, group_results):
+                result[index] = step_result
+        return result
+
     async def enquire(self, host: Executor) -> bool:
         raise NotImplementedError()
 
@@ -49,9 +72,9 @@ class Collection(Fact):
     @property
     def description(self) -> str:
         if self.title:
-            return "{} with {} facts".format(self.title, str(len(self.facts)))
+            return f"{self.title} with {len(self.facts)} facts"
         else:
-            return "with {} facts".format(str(len(self.facts)))
+            return f"with {len(self.facts)} facts"
 
 
 class Sequence(Collection):
@@ -59,6 +82,8 @@ class Sequence(Collection):
     Ordered collection of facts. Each will be applied after the previous one.
     """
 
+    __slots__ = ()
+
     async def apply(self, host: Executor):
         result = []
         for step in self.facts:
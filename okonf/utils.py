@@ -1,9 +1,16 @@
+import os
+import shlex
+from functools import lru_cache
+from hashlib import sha256
 from os.path import isfile
+from typing import List, Tuple
 import logging
 import asyncio
-from asyncio.subprocess import create_subprocess_exec
 from colorama import Fore
 
+# Size of the chunks read when hashing local files, to keep memory usage constant.
+HASH_CHUNK_SIZE = 1 << 20
+
 
 def run_coroutine(task, debug=False):
     loop = asyncio.get_event_loop()
@@ -13,20 +20,56 @@ def run_coroutine(task, debug=False):
     return result
 
 
+@lru_cache(maxsize=4096)
+def _hash_local_file(file_path: str, mtime_ns: int, size: int) -> bytes:
+    """Hash a local file by chunks. The modification time and size are only
+    used as part of the cache key, so that modified files are hashed again."""
+    file_hash = sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.digest()
+
+
 async def get_local_file_hash(file_path: str) -> bytes:
-    """Get the sha256 hash of a file on the local filesyste."""
+    """Get the raw sha256 digest of a file on the local filesystem."""
     if not isfile(file_path):
-        raise FileNotFoundError("No such file or directory: '{}'".format(file_path))
+        raise FileNotFoundError(f"No such file or directory: '{file_path}'")
 
-    subprocess = await create_subprocess_exec(
-        "sha256sum", file_path, stdout=asyncio.subprocess.PIPE
+    stat = os.stat(file_path)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        None, _hash_local_file, file_path, stat.st_mtime_ns, stat.st_size
     )
 
-    if subprocess.stdout:
-        local_hash = await subprocess.stdout.read()
-        return local_hash.split(b" ", 1)[0]
-    else:
-        return b""
+
+def scan_local_directory(path: str) -> Tuple[List[str], List[str]]:
+    """List the paths of all directories and files below a local directory.
+
+    Like os.walk, symbolic links to directories are listed as directories
+    without being followed, but the type of each entry comes from the
+    directory listing instead of an extra stat() call."""
+    dirs: List[str] = []
+    files: List[str] = []
+    to_scan = [path]
+    while to_scan:
+        with os.scandir(to_scan.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    dirs.append(entry.path)
+                    if not entry.is_symlink():
+                        to_scan.append(entry.path)
+                else:
+                    files.append(entry.path)
+    return dirs, files
+
+
+def quote_path(path: str) -> str:
+    """Quote a path for use in shell commands, leaving a leading `~/`
+    unquoted so that the shell still expands the home directory."""
+    if path.startswith("~/"):
+        return "~/" + shlex.quote(path[2:])
+    return shlex.quote(path)
 
 
 def setup_logger(debug, info):
@@ -48,7 +91,7 @@ def format_collection_result(result, level: int = 0):
     output = ""
     if level == 0:
         output += f"{Fore.LIGHTBLUE_EX}{result.hostname}{Fore.WHITE}\n"
-    output += "{}- {}\n".format("  " * level, result)
+    output += f"{'  ' * level}- {result}\n"
     try:
         for r in result.result:
             output += format_collection_result(r, level=level + 1)
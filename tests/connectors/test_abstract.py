@@ -0,0 +1,32 @@
+import os
+from shutil import copyfile
+
+import pytest
+
+from okonf.connectors.abstract import Executor, CommandResult
+
+
+class UploadExecutor(Executor):
+    """Executor implementing only the abstract methods."""
+
+    async def run(self, command, env=None) -> CommandResult:
+        raise NotImplementedError()
+
+    async def put(self, path, local_path) -> None:
+        copyfile(local_path, path)
+
+    @property
+    def hostname(self):
+        return "upload host"
+
+
+@pytest.mark.asyncio
+async def test_put_content():
+    # Executors without their own put_content upload a temporary file
+    host = UploadExecutor(is_root=False)
+    path = "/tmp/filename"
+    try:
+        await host.put_content(path, b"content")
+        assert open(path, "rb").read() == b"content"
+    finally:
+        os.remove(path)
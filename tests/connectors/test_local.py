@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from okonf.connectors.exceptions import NoSuchFileError, ShellError
+from okonf.connectors.local import LocalHost
+
+
+@pytest.mark.asyncio
+async def test_stream_output():
+    async with LocalHost() as host:
+        records = [
+            record async for record in host.stream_output("printf 'a b\\nc\\n\\nd'")
+        ]
+        assert records == ["a b", "c", "d"]
+
+        records = [
+            record
+            async for record in host.stream_output(
+                "printf 'a\\nb\\0c\\0'", separator="\0"
+            )
+        ]
+        assert records == ["a\nb", "c"]
+
+
+@pytest.mark.asyncio
+async def test_stream_output_errors():
+    async with LocalHost() as host:
+        with pytest.raises(NoSuchFileError):
+            async for _ in host.stream_output("ls /no/such/path", no_such_file=True):
+                pass
+
+        with pytest.raises(ShellError):
+            async for _ in host.stream_output("echo partial; exit 1"):
+                pass
+
+        records = [record async for record in host.stream_output("exit 1", check=False)]
+        assert records == []
+
+
+@pytest.mark.asyncio
+async def test_stream_output_stopped():
+    async with LocalHost() as host:
+        records = host.stream_output("echo $$; sleep 60")
+        async for record in records:
+            pid = int(record)
+            break
+        # The command is killed when the consumer stops iterating
+        await records.aclose()
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
@@ -4,7 +4,8 @@ import pytest
 
 from okonf import Collection, Sequence
 from okonf.connectors.local import LocalHost
-from okonf.facts.files import FilePresent
+from okonf.facts.abstract import FactCheck, FactResult, all_true, any_true
+from okonf.facts.files import FilePresent, DirectoryCopy
 
 
 @pytest.mark.asyncio
@@ -77,3 +78,62 @@ async def test_Sequence():
         finally:
             os.remove(filename1)
             os.remove(filename2)
+
+
+def test_all_true():
+    assert all_true([])
+    assert all_true([True, [True, (True,)], []])
+    assert not all_true([True, [True, [False]]])
+    assert not all_true(["", "text"])
+    assert all_true(["text"])
+
+
+def test_any_true():
+    assert not any_true([])
+    assert not any_true([[], [False, ()]])
+    assert any_true([False, [False, [True]]])
+    assert not any_true([""])
+    assert any_true(["text"])
+
+
+def test_Fact_str():
+    fact = DirectoryCopy("/tmp/dirname", "tests")
+    assert str(fact) is str(fact)
+    assert "_str_cache" not in fact.description
+    assert "/tmp/dirname" in str(fact)
+    assert fact.description == str(
+        {
+            "remote_path": "/tmp/dirname",
+            "local_path": "tests",
+            "delete": False,
+            "fingerprint": False,
+        }
+    )
+
+    # The cached strings are rebuilt after the fact is modified
+    fact.remote_path = "/tmp/other"
+    fact.clear_cache()
+    assert "/tmp/other" in str(fact)
+    assert "/tmp/other" in repr(fact)
+
+
+def test_Fact_slots():
+    # Facts declare their attributes in slots, without a __dict__
+    assert not hasattr(FilePresent("/tmp/filename"), "__dict__")
+    assert not hasattr(DirectoryCopy("/tmp/dirname", "tests"), "__dict__")
+    assert not hasattr(Collection([]), "__dict__")
+
+
+@pytest.mark.asyncio
+async def test_FactCheck_hash():
+    async with LocalHost() as host:
+        fact = FilePresent("/tmp/filename")
+        check = FactCheck(fact, True, host)
+        assert check == True  # noqa: E712
+        assert check != False  # noqa: E712
+        assert check == FactCheck(fact, True, host)
+        assert check != FactCheck(FilePresent("/tmp/filename"), True, host)
+
+        # Results can be used as keys to deduplicate them
+        results = {FactResult(fact, [True, False], host), FactResult(fact, True, host)}
+        assert len(results) == 1
@@ -2,8 +2,35 @@ import os.path
 
 import pytest
 
+from okonf import Collection
+from okonf.connectors.abstract import CommandResult, Executor
 from okonf.connectors.local import LocalHost
-from okonf.facts.apt import AptPresent, AptAbsent, parse_upgradeable
+from okonf.facts.apt import AptPresent, AptAbsent, AptUpdated, parse_upgradeable
+
+
+class RecordingExecutor(Executor):
+    """Executor recording the commands run, with the given packages installed."""
+
+    def __init__(self, installed):
+        super().__init__(is_root=True)
+        self.installed = installed
+        self.commands = []
+
+    async def run(self, command, env=None) -> CommandResult:
+        self.commands.append(command)
+        stdout = ""
+        if command.startswith("dpkg-query"):
+            for name in self.installed:
+                if name in command.split():
+                    stdout += f"{name} 1.0 install ok installed\n"
+        return CommandResult(exit_code=0, stdout=stdout.encode(), stderr=b"")
+
+    async def put(self, path, local_path) -> None:
+        raise NotImplementedError()
+
+    @property
+    def hostname(self):
+        return "recording host"
 
 
 @pytest.mark.asyncio
@@ -18,13 +45,77 @@ async def test_AptPresent():
         assert not os.path.isfile("/usr/bin/tree")
 
 
+@pytest.mark.asyncio
+async def test_AptPresent_enquire_many():
+    async with LocalHost() as host:
+        installed = await AptPresent.enquire_many(host, ["mount", "not-a-package"])
+        assert installed.keys() == {"mount", "not-a-package"}
+        assert installed["mount"]
+        assert installed["not-a-package"] is None
+        assert await AptPresent("mount", version=installed["mount"]).check(host)
+        assert not await AptPresent("mount", version="0.0").check(host)
+
+
+@pytest.mark.asyncio
+async def test_AptPresent_special_characters():
+    async with LocalHost() as host:
+        # Package names may contain characters that are special in regexes
+        assert await AptPresent("libstdc++6").check(host)
+        assert not await AptPresent("libstdc..6").check(host)
+
+
+@pytest.mark.asyncio
+async def test_AptPresent_Collection():
+    async with LocalHost() as host:
+        packages = Collection(
+            (
+                AptPresent("mount"),
+                AptAbsent("not-a-package"),
+                AptPresent("libstdc++6"),
+                AptPresent("not-a-package"),
+            )
+        )
+        # Packages of the same class are checked together, results keep the order
+        assert await packages.check(host) == [True, True, True, False]
+
+        present = Collection((AptPresent("mount"), AptAbsent("not-a-package")))
+        assert await present.apply(host) == [False, False]
+
+
+@pytest.mark.asyncio
+async def test_Apt_Collection_coalesced():
+    host = RecordingExecutor(installed={"c", "d", "e"})
+    packages = Collection(
+        (
+            AptPresent("a"),
+            AptUpdated(),
+            AptPresent("b"),
+            AptPresent("c"),
+            AptAbsent("d"),
+            AptAbsent("e", purge=True),
+            AptAbsent("f"),
+            AptUpdated(),
+        )
+    )
+    result = await packages.apply(host)
+    assert result == [True, True, True, False, True, True, False, False]
+
+    # One command per kind of change, the types of facts are applied concurrently
+    changes = [command for command in host.commands if "apt-get" in command]
+    assert sorted(changes) == [
+        "apt-get install -y a b",
+        "apt-get remove  -y d",
+        "apt-get remove --purge -y e",
+        "sudo apt-get update",
+    ]
+    assert host.counters["apt-update"] == 1
+
+
 APT_UPGRADABLE = """
 Listing... Done
 juk/testing 4:20.12.3-1 amd64 [upgradable from: 4:20.12.0-1]
 konsole-kpart/testing 4:20.12.3-1 amd64 [upgradable from: 4:20.12.2-1]
-""".split(
-    "\n"
-)
+"""
 
 
 def test_parse_upgradeable():
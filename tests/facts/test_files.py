@@ -1,8 +1,9 @@
 import os
+from hashlib import sha256
 import pytest
 from shutil import rmtree
 
-from okonf.connectors.local import LocalHost
+from okonf.connectors.local import LocalExecutor, LocalHost
 from okonf.facts.files import (
     FilePresent,
     FileAbsent,
@@ -13,6 +14,19 @@ from okonf.facts.files import (
     DirectoryAbsent,
     DirectoryCopy,
 )
+from okonf.utils import get_local_file_hash
+
+
+class RecordingExecutor(LocalExecutor):
+    """Local executor recording the commands run."""
+
+    def __init__(self):
+        super().__init__(is_root=os.getuid() == 0)
+        self.commands = []
+
+    async def run(self, command, env=None):
+        self.commands.append(command)
+        return await super().run(command, env=env)
 
 
 @pytest.mark.asyncio
@@ -32,6 +46,22 @@ async def test_FilePresent():
             os.remove(filename)
 
 
+@pytest.mark.asyncio
+async def test_FilePresent_special_characters():
+    async with LocalHost() as host:
+        filename = "/tmp/filename with $HOME"
+        assert not await FilePresent(filename).check(host)
+        try:
+            assert await FilePresent(filename).apply(host)
+            assert os.path.isfile(filename)
+            assert await FileHash(filename, sha256(b"").digest()).check(host)
+            assert await FileAbsent(filename).apply(host)
+            assert not os.path.exists(filename)
+        finally:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
 @pytest.mark.asyncio
 async def test_FileMode():
     async with LocalHost() as host:
@@ -75,13 +105,15 @@ async def test_FileHash():
         expected_hash = (
             b"ed7002b439e9ac845f22357d822bac14" b"44730fbdb6016d3ec9432297b9ec9f73"
         )
+        expected_digest = bytes.fromhex(expected_hash.decode())
 
         assert not os.path.isfile(filename)
         assert not await FileHash(filename, b"hash").check(host)
         try:
             open(filename, "wb").write(b"content")
-            assert await FileHash(filename, b"").get_hash(host) == expected_hash
+            assert await FileHash(filename, b"").get_hash(host) == expected_digest
             assert await FileHash(filename, expected_hash).check(host)
+            assert await FileHash(filename, expected_digest).check(host)
         finally:
             os.remove(filename)
 
@@ -97,10 +129,41 @@ async def test_FileCopy():
         try:
             assert await FileCopy(remote_path, local_path).apply(host)
             assert open(local_path, "rb").read() == open(remote_path, "rb").read()
+
         finally:
             os.remove(remote_path)
 
 
+@pytest.mark.asyncio
+async def test_FileCopy_local_hash():
+    async with LocalHost() as host:
+        remote_path = "/tmp/filename"
+        local_path = "/tmp/filename_local"
+        with open(local_path, "wb") as f:
+            f.write(b"content\n")
+
+        try:
+            fact = FileCopy(remote_path, local_path)
+            assert await fact.apply(host)
+            assert await fact.check(host)
+
+            # The known remote hash can be given raw or in hexadecimal
+            digest = await get_local_file_hash(local_path)
+            for remote_hash in (digest, digest.hex().encode(), digest.hex()):
+                known = FileCopy(remote_path, local_path, remote_hash=remote_hash)
+                assert known.remote_hash == digest
+                assert await known.check(host)
+
+            # The local hash is reused until the local file changes
+            assert await fact.get_local_hash() is await fact.get_local_hash()
+            with open(local_path, "ab") as f:
+                f.write(b"modified\n")
+            assert not await fact.check(host)
+        finally:
+            os.remove(local_path)
+            os.remove(remote_path)
+
+
 @pytest.mark.asyncio
 async def test_FileContent():
     async with LocalHost() as host:
@@ -183,9 +246,32 @@ async def test_DirectoryCopy():
             # assert len(result.result[0][1]) > 0
             # TODO: handle recursive facts, check() should return False
             assert await DirectoryCopy(remote_path, local_path).check(host)
+
+            # Remote paths are listed relative to the remote directory
+            files, dirs = await DirectoryCopy(remote_path, local_path).info_remote(host)
+            assert "" in dirs
+            assert "facts" in dirs
+            assert files["facts/test_files.py"] == await get_local_file_hash(
+                "tests/facts/test_files.py"
+            )
         finally:
             rmtree(remote_path)
 
+        files, dirs = await DirectoryCopy(remote_path, local_path).info_remote(host)
+        assert files == {} and dirs == set()
+
+
+@pytest.mark.asyncio
+async def test_DirectoryCopyHome(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    async with LocalHost() as host:
+        fact = DirectoryCopy("~/dirname", "tests")
+        assert not await fact.check(host)
+        assert await fact.apply(host)
+        assert os.path.isfile(tmp_path / "dirname" / "facts" / "test_files.py")
+        assert await fact.check(host)
+        assert not await fact.apply(host)
+
 
 @pytest.mark.asyncio
 async def test_DirectoryCopyDelete():
@@ -204,5 +290,143 @@ async def test_DirectoryCopyDelete():
             # assert len(result.result[0][1]) > 0
             # TODO: handle recursive facts, check() should return False
             assert await DirectoryCopy(remote_path, local_path, delete=True).check(host)
+
+            # Extra remote files and directories are removed
+            os.makedirs(f"{remote_path}/extra_dir")
+            open(f"{remote_path}/extra_file", "wb").write(b"content")
+            assert not await DirectoryCopy(remote_path, local_path, delete=True).check(
+                host
+            )
+            assert await DirectoryCopy(remote_path, local_path, delete=True).apply(host)
+            assert not os.path.exists(f"{remote_path}/extra_dir")
+            assert not os.path.exists(f"{remote_path}/extra_file")
+            assert os.path.isfile(f"{remote_path}/test_utils.py")
         finally:
             rmtree(remote_path)
+
+
+@pytest.mark.asyncio
+async def test_DirectoryCopyFingerprint():
+    async with LocalHost() as host:
+        local_path = "tests"
+        remote_path = "/tmp/dirname"
+
+        fact = DirectoryCopy(remote_path, local_path, fingerprint=True)
+        assert await fact.remote_fingerprint(host) is None
+        assert not await fact.check(host)
+        try:
+            assert await fact.apply(host)
+            assert await fact.remote_fingerprint(host) == await fact.local_fingerprint()
+
+            # Directories in sync are checked without listing each file
+            result = await fact.check(host)
+            assert result.result is True
+            assert not await fact.apply(host)
+
+            open(f"{remote_path}/test_utils.py", "ab").write(b"\n")
+            assert not await fact.in_sync(host)
+            assert not await fact.check(host)
+            assert await fact.apply(host)
+            assert await fact.in_sync(host)
+        finally:
+            rmtree(remote_path)
+
+
+@pytest.mark.asyncio
+async def test_DirectoryCopyHomeDelete(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    remote_path = tmp_path / "dirname"
+    async with LocalHost() as host:
+        fact = DirectoryCopy("~/dirname", "tests", delete=True)
+        assert await fact.apply(host)
+        assert await fact.check(host)
+
+        # Only the extra paths are removed, not the copied files or the root
+        os.makedirs(remote_path / "extra_dir")
+        open(remote_path / "extra_file", "wb").write(b"content")
+        files_to_remove, dirs_to_remove = (await fact.subfacts(host)).facts[1].facts
+        assert [f.remote_path for f in files_to_remove.facts] == [
+            "~/dirname/extra_file"
+        ]
+        assert [f.remote_path for f in dirs_to_remove.facts] == ["~/dirname/extra_dir"]
+        assert await fact.apply(host)
+        assert not os.path.exists(remote_path / "extra_dir")
+        assert not os.path.exists(remote_path / "extra_file")
+        assert os.path.isfile(remote_path / "test_utils.py")
+        assert await fact.check(host)
+
+
+def test_DirectoryCopy_is_below_root():
+    assert DirectoryCopy._is_below_root("facts/test_files.py")
+    assert not DirectoryCopy._is_below_root("")
+    assert not DirectoryCopy._is_below_root("/tmp/dirname")
+    assert not DirectoryCopy._is_below_root("../dirname")
+
+
+OLD_SHA256SUM = """#!/bin/sh
+case "$*" in
+    *--zero*) echo "sha256sum: unrecognized option '--zero'" >&2; exit 1;;
+esac
+exec /usr/bin/sha256sum "$@"
+"""
+
+
+@pytest.mark.asyncio
+async def test_DirectoryCopy_without_zero(tmp_path, monkeypatch):
+    # Older versions of sha256sum do not support --zero
+    bin_path = tmp_path / "bin"
+    bin_path.mkdir()
+    (bin_path / "sha256sum").write_text(OLD_SHA256SUM)
+    (bin_path / "sha256sum").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_path}:{os.environ['PATH']}")
+
+    local_path = tmp_path / "local"
+    (local_path / "sub dir").mkdir(parents=True)
+    (local_path / "sub dir" / "back\\slash").write_bytes(b"content")
+    (local_path / "file").write_bytes(b"content")
+    remote_path = str(tmp_path / "remote")
+
+    async with LocalHost() as host:
+        fact = DirectoryCopy(remote_path, str(local_path))
+        assert not await fact.check(host)
+        assert await fact.apply(host)
+
+        files, dirs = await fact.info_remote(host)
+        assert dirs == {"", "sub dir"}
+        assert files.keys() == {"file", "sub dir/back\\slash"}
+        assert await fact.check(host)
+        assert not await fact.apply(host)
+
+
+@pytest.mark.asyncio
+async def test_DirectoryCopy_absent_files(tmp_path):
+    local_path = tmp_path / "local"
+    local_path.mkdir()
+    (local_path / "file").write_bytes(b"content")
+    remote_path = tmp_path / "remote"
+    remote_path.mkdir()
+
+    # Files missing from the listing of their directory are not hashed
+    host = RecordingExecutor()
+    fact = DirectoryCopy(str(remote_path), str(local_path))
+    assert not await fact.check(host)
+    assert not [command for command in host.commands if "sha256sum" in command]
+
+
+@pytest.mark.asyncio
+async def test_DirectoryCopy_symbolic_link(tmp_path):
+    local_path = tmp_path / "local"
+    (local_path / "sub").mkdir(parents=True)
+    (local_path / "sub" / "file").write_bytes(b"content")
+    real_path = tmp_path / "real"
+    real_path.mkdir()
+    (real_path / "file").write_bytes(b"content")
+    remote_path = tmp_path / "remote"
+    remote_path.mkdir()
+    (remote_path / "sub").symlink_to(real_path)
+
+    # Files below a remote symbolic link to a directory are not listed
+    async with LocalHost() as host:
+        fact = DirectoryCopy(str(remote_path), str(local_path))
+        assert await fact.check(host)
+        assert not await fact.apply(host)
@@ -2,14 +2,14 @@ import os
 import pytest
 from hashlib import sha256
 
-from okonf.utils import get_local_file_hash
+from okonf.utils import get_local_file_hash, quote_path, scan_local_directory
 
 
 @pytest.mark.asyncio
 async def test_get_local_file_hash():
     filepath = "/tmp/file_for_test"
     content = b"This is the file content\n"
-    content_hash = sha256(content).hexdigest().encode()
+    content_hash = sha256(content).digest()
 
     try:
         with open(filepath, "wb") as f:
@@ -18,3 +18,40 @@ async def test_get_local_file_hash():
         assert file_hash == content_hash
     finally:
         os.remove(filepath)
+
+
+@pytest.mark.asyncio
+async def test_get_local_file_hash_modified():
+    filepath = "/tmp/file_for_test"
+
+    try:
+        with open(filepath, "wb") as f:
+            f.write(b"First content\n")
+        first_hash = await get_local_file_hash(filepath)
+        assert await get_local_file_hash(filepath) == first_hash
+
+        with open(filepath, "wb") as f:
+            f.write(b"Second, longer content\n")
+        second_hash = await get_local_file_hash(filepath)
+        assert second_hash == sha256(b"Second, longer content\n").digest()
+    finally:
+        os.remove(filepath)
+
+
+def test_scan_local_directory():
+    dirs, files = scan_local_directory("tests")
+
+    expected_dirs, expected_files = [], []
+    for root, walk_dirs, walk_files in os.walk("tests"):
+        expected_dirs += [os.path.join(root, name) for name in walk_dirs]
+        expected_files += [os.path.join(root, name) for name in walk_files]
+
+    assert sorted(dirs) == sorted(expected_dirs)
+    assert sorted(files) == sorted(expected_files)
+
+
+def test_quote_path():
+    assert quote_path("/tmp/filename") == "/tmp/filename"
+    assert quote_path("/tmp/file name") == "'/tmp/file name'"
+    assert quote_path("/tmp/$(reboot)") == "'/tmp/$(reboot)'"
+    assert quote_path("~/file name") == "~/'file name'"